@@ -0,0 +1,81 @@
+"""
+Export QOR collections for analytics without going through the live API.
+
+Usage: python export_data.py tasks --format parquet -o tasks.parquet [--state-file .export_state.json]
+
+With --state-file, the watermark of each completed export is saved per
+collection and the next run only exports documents created after it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from export_service import (
+    DEFAULT_BATCH_SIZE, EXPORT_FORMATS, EXPORT_SCHEMAS, export_watermark, format_available, normalize_timestamp,
+    stream_export
+)
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def timestamp_arg(value):
+    try:
+        return normalize_timestamp(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid ISO timestamp: {value!r}")
+
+
+def load_state(path):
+    if path and Path(path).exists():
+        return json.loads(Path(path).read_text())
+    return {}
+
+
+async def export(args):
+    state = load_state(args.state_file)
+    since = args.since or state.get(args.collection)
+    watermark = export_watermark()
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    output = args.output or f"{args.collection}.{EXPORT_FORMATS[args.format][1]}"
+    written = 0
+    try:
+        with open(output, "wb") as f:
+            async for chunk in stream_export(db, args.collection, args.format, since, watermark, args.batch_size):
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        client.close()
+
+    # Only advance the watermark once the file is complete
+    if args.state_file:
+        state[args.collection] = watermark
+        Path(args.state_file).write_text(json.dumps(state, indent=2))
+    print(f"Exported {args.collection} since {since or 'the beginning'} -> {output} ({written} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export QOR collections for analytics")
+    parser.add_argument("collection", choices=sorted(EXPORT_SCHEMAS))
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("-o", "--output", help="output file (default: <collection>.<ext>)")
+    parser.add_argument("--since", type=timestamp_arg, help="only export documents created after this ISO timestamp")
+    parser.add_argument("--state-file", help="JSON file holding per-collection watermarks")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not format_available(args.format):
+        parser.error(f"{args.format} export requires pyarrow")
+    asyncio.run(export(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Export Service for QOR Network
+Streams collections out of MongoDB as gzipped CSV, Parquet or Arrow IPC in
+fixed-size record batches, so memory stays bounded by the batch size
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Exported columns per collection: (field, kind)
+EXPORT_SCHEMAS = {
+    "robots": [
+        ("id", "string"), ("id_hash", "string"), ("owner", "string"), ("name", "string"),
+        ("description", "string"), ("capabilities", "list"), ("metadata_uri", "string"),
+        ("reputation", "int"), ("stake", "float"), ("active", "bool"), ("created_at", "string"),
+    ],
+    "tasks": [
+        ("id", "string"), ("robot_id", "string"), ("title", "string"), ("description", "string"),
+        ("waypoints", "json"), ("deadline", "string"), ("required_score", "float"),
+        ("yes_pool", "float"), ("no_pool", "float"), ("yes_shares", "float"), ("no_shares", "float"),
+        ("status", "string"), ("success", "bool"), ("resolver", "string"),
+        ("solution_uri", "string"), ("evidence_uri", "string"), ("optimization_score", "float"),
+        ("route_length", "float"), ("location", "json"), ("created_at", "string"),
+    ],
+    "positions": [
+        ("id", "string"), ("task_id", "string"), ("user", "string"), ("side", "string"),
+        ("shares", "float"), ("cost", "float"), ("redeemed", "bool"), ("created_at", "string"),
+    ],
+    "proposals": [
+        ("id", "string"), ("title", "string"), ("description", "string"), ("action", "string"),
+        ("proposer", "string"), ("yes_votes", "float"), ("no_votes", "float"), ("voters", "int"),
+        ("total_weight", "float"), ("status", "string"), ("created_at", "string"),
+    ],
+}
+
+EXPORT_FORMATS = {
+    "csv": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+DEFAULT_BATCH_SIZE = 5000
+
+# created_at is stamped in Python before insert_one, so a document can commit
+# a little after its timestamp; keep the watermark behind that window
+WATERMARK_LAG = timedelta(seconds=10)
+
+
+def format_available(fmt):
+    return fmt == "csv" or (fmt in EXPORT_FORMATS and pa is not None)
+
+
+def normalize_timestamp(value):
+    """ISO-8601 timestamp as a UTC isoformat() string; naive values are UTC.
+
+    Raises ValueError for anything that is not an ISO-8601 timestamp.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def export_watermark():
+    """Upper created_at bound for an export, and `since` for the next one"""
+    return (datetime.now(timezone.utc) - WATERMARK_LAG).isoformat()
+
+
+def export_query(since=None, until=None):
+    # created_at is an ISO-8601 UTC string, so range comparisons are chronological
+    query = {}
+    if since or until:
+        query["created_at"] = {}
+        if since:
+            query["created_at"]["$gt"] = since
+        if until:
+            query["created_at"]["$lte"] = until
+    return query
+
+
+async def iter_batches(collection, fields, query, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield lists of at most batch_size documents from a Motor cursor"""
+    projection = {"_id": 0}
+    projection.update({name: 1 for name, _ in fields})
+    cursor = collection.find(query, projection).sort("created_at", 1).batch_size(batch_size)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_value(value, kind):
+    if value is None:
+        return ""
+    if kind in ("list", "json"):
+        return json.dumps(value)
+    return value
+
+
+async def stream_csv(batches, fields):
+    """Gzipped CSV, one compressed chunk per record batch"""
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow([name for name, _ in fields])
+    async for batch in batches:
+        for doc in batch:
+            writer.writerow([_csv_value(doc.get(name), kind) for name, kind in fields])
+        # Sync-flush so each batch reaches the client instead of sitting in zlib
+        chunk = compressor.compress(text.getvalue().encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        text.seek(0)
+        text.truncate()
+        if chunk:
+            yield chunk
+    chunk = compressor.compress(text.getvalue().encode()) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose buffered bytes can be taken between batches"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema(fields):
+    types = {
+        "string": pa.string(),
+        "json": pa.string(),
+        "list": pa.list_(pa.string()),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in fields])
+
+
+def _record_batch(batch, fields, schema):
+    columns = []
+    for name, kind in fields:
+        values = [doc.get(name) for doc in batch]
+        if kind == "json":
+            values = [None if v is None else json.dumps(v) for v in values]
+        columns.append(values)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+async def stream_arrow(batches, fields, fmt):
+    """Parquet (one row group per batch) or Arrow IPC stream"""
+    schema = _arrow_schema(fields)
+    sink = _DrainableSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        async for batch in batches:
+            record_batch = _record_batch(batch, fields, schema)
+            if fmt == "parquet":
+                writer.write_table(pa.Table.from_batches([record_batch]))
+            else:
+                writer.write_batch(record_batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+def stream_export(db, collection, fmt, since=None, until=None, batch_size=DEFAULT_BATCH_SIZE):
+    fields = EXPORT_SCHEMAS[collection]
+    batches = iter_batches(db[collection], fields, export_query(since, until), batch_size)
+    if fmt == "csv":
+        return stream_csv(batches, fields)
+    return stream_arrow(batches, fields, fmt)
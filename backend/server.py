@@ -1,16 +1,25 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import hashlib
 import random
+import asyncio
+import json
+import math
+import time
+import numpy as np
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -30,6 +39,11 @@ except Exception as e:
     print(f"⚠️  Web3 service not available: {e}")
     web3_service = None
 
+from export_service import (
+    EXPORT_SCHEMAS, EXPORT_FORMATS, DEFAULT_BATCH_SIZE, export_watermark, format_available, normalize_timestamp,
+    stream_export
+)
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
@@ -41,6 +55,7 @@ class RobotRegister(BaseModel):
     description: str
     capabilities: List[str]
     stake_amount: float
+    owner: Optional[str] = None  # wallet address; mock owner id when omitted
 
 class Robot(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -89,8 +104,14 @@ class Task(BaseModel):
     solution_uri: Optional[str] = None
     evidence_uri: Optional[str] = None
     optimization_score: Optional[float] = None
+    route_length: Optional[float] = None  # length of the stored route, when waypoints have coordinates
+    location: Optional[Dict[str, Any]] = None  # GeoJSON MultiPoint of lat/lon waypoints
+    payout_version: int = 0  # bumped by every trade, resolution and redemption
     created_at: str
 
+class NearbyTask(Task):
+    distance_km: float
+
 class Position(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -102,10 +123,47 @@ class Position(BaseModel):
     redeemed: bool = False
     created_at: str
 
+# Payout preview for one user in one market
+class PayoutEntry(BaseModel):
+    task_id: str
+    user: str
+    status: str
+    yes_shares: float
+    no_shares: float
+    cost: float
+    payout_if_yes: float
+    payout_if_no: float
+    final_payout: Optional[float] = None  # set once the market is resolved
+    claimable: Optional[float] = None  # unredeemed part of final_payout
+
+class UserPayouts(BaseModel):
+    user: str
+    total_cost: float
+    total_final_payout: float
+    total_claimable: float
+    markets: List[PayoutEntry]
+
+# Price history bar (OHLC of the YES price, yes_pool / total pool)
+class PriceBar(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    task_id: str
+    resolution: str
+    start: str
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float = 0.0
+    trades: int = 0
+
 # Optimizer Models
 class OptimizeRequest(BaseModel):
     task_id: str
 
+class AnytimeOptimizeRequest(BaseModel):
+    task_id: str
+    time_budget: float = Field(10.0, gt=0, le=60)  # seconds of search before the stream closes
+
 class OptimizeResult(BaseModel):
     task_id: str
     solution_uri: str
@@ -138,13 +196,22 @@ class Proposal(BaseModel):
     proposer: str
     yes_votes: float = 0.0
     no_votes: float = 0.0
+    voters: int = 0
+    total_weight: float = 0.0  # sum of snapshot weights eligible to vote
     status: str = "active"  # active, executed, rejected
     created_at: str
 
 class Vote(BaseModel):
     proposal_id: str
+    voter: str
     support: bool
-    weight: float = 1.0
+
+class BallotEntry(BaseModel):
+    voter: str
+    support: bool
+
+class BulkVote(BaseModel):
+    votes: List[BallotEntry]
 
 # IPFS Mock
 class IPFSUpload(BaseModel):
@@ -177,7 +244,7 @@ async def register_robot(input: RobotRegister):
     robot = Robot(
         id=robot_id,
         id_hash=id_hash,
-        owner="user_" + str(uuid.uuid4())[:8],
+        owner=input.owner or "user_" + str(uuid.uuid4())[:8],
         name=input.name,
         description=input.description,
         capabilities=input.capabilities,
@@ -196,6 +263,52 @@ async def list_robots():
     robots = await db.robots.find({}, {"_id": 0}).to_list(1000)
     return robots
 
+# Sortable fields for /robots/search; prefix with "-" for descending
+ROBOT_SORT_FIELDS = {"reputation", "stake", "created_at", "name"}
+
+# Serve capability/active/reputation filters and the reputation sort
+# (id last matches the sort tie-break, so the order comes from the index)
+ROBOT_SEARCH_INDEXES = [
+    [("capabilities", ASCENDING), ("active", ASCENDING), ("reputation", DESCENDING), ("id", ASCENDING)],
+    [("active", ASCENDING), ("reputation", DESCENDING), ("id", ASCENDING)],
+]
+
+def robot_search_query(capability=None, min_reputation=None, active=None):
+    query = {}
+    if capability:
+        query["capabilities"] = {"$all": capability}
+    if min_reputation is not None:
+        query["reputation"] = {"$gte": min_reputation}
+    if active is not None:
+        query["active"] = active
+    return query
+
+def robot_search_sort(sort):
+    field = sort.lstrip("-")
+    if field not in ROBOT_SORT_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported sort field. Use one of: {', '.join(sorted(ROBOT_SORT_FIELDS))}"
+        )
+    direction = DESCENDING if sort.startswith("-") else ASCENDING
+    # Tie-break on id so pages are stable
+    return [(field, direction), ("id", ASCENDING)]
+
+@api_router.get("/robots/search", response_model=List[Robot])
+async def search_robots(
+    capability: Optional[List[str]] = Query(None),
+    min_reputation: Optional[int] = None,
+    active: Optional[bool] = None,
+    sort: str = "-reputation",
+    offset: int = 0,
+    limit: int = 50
+):
+    robots = await db.robots.find(
+        robot_search_query(capability, min_reputation, active),
+        {"_id": 0}
+    ).sort(robot_search_sort(sort)).skip(max(offset, 0)).limit(min(max(limit, 1), 500)).to_list(None)
+    return robots
+
 @api_router.get("/robots/{robot_id}", response_model=Robot)
 async def get_robot(robot_id: str):
     robot = await db.robots.find_one({"id": robot_id}, {"_id": 0})
@@ -252,6 +365,25 @@ async def delete_robot(robot_id: str):
     return {"message": "Robot deleted", "robot_id": robot_id}
 
 # ===== TASKS/MARKETS =====
+def _waypoints_geojson(waypoints):
+    # Normalise lat/lon (or lat/lng) waypoints into a GeoJSON MultiPoint;
+    # waypoints without coordinates are left out
+    coordinates = []
+    for wp in waypoints:
+        lon = wp.get("lon", wp.get("lng"))
+        if "lat" not in wp or lon is None:
+            continue
+        try:
+            lat, lon = float(wp["lat"]), float(lon)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid waypoint coordinates")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise HTTPException(status_code=400, detail="Invalid waypoint coordinates")
+        coordinates.append([lon, lat])
+    if not coordinates:
+        return None
+    return {"type": "MultiPoint", "coordinates": coordinates}
+
 @api_router.post("/tasks/create", response_model=Task)
 async def create_task(input: TaskCreate):
     # Verify robot exists
@@ -269,6 +401,7 @@ async def create_task(input: TaskCreate):
         deadline=input.deadline,
         required_score=input.required_score,
         resolver="oracle_" + str(uuid.uuid4())[:8],
+        location=_waypoints_geojson(input.waypoints),
         created_at=datetime.now(timezone.utc).isoformat()
     )
     
@@ -280,6 +413,54 @@ async def list_tasks():
     tasks = await db.tasks.find({}, {"_id": 0}).to_list(1000)
     return tasks
 
+async def _backfill_task_locations(batch_size=1000):
+    # Tasks created before waypoints were indexed get their location once;
+    # tasks without usable coordinates are marked with location None
+    cursor = db.tasks.find({"location": {"$exists": False}}, {"_id": 0, "id": 1, "waypoints": 1})
+    ops = []
+    async for task in cursor:
+        try:
+            location = _waypoints_geojson(task.get("waypoints") or [])
+        except HTTPException:
+            location = None
+        ops.append(UpdateOne({"id": task["id"]}, {"$set": {"location": location}}))
+        if len(ops) >= batch_size:
+            await db.tasks.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.tasks.bulk_write(ops, ordered=False)
+
+@api_router.get("/tasks/near", response_model=List[NearbyTask])
+async def list_tasks_near(
+    lat: float,
+    lon: float,
+    radius_km: float = Query(10.0, gt=0, le=1000),
+    status: Optional[str] = "active",
+    limit: int = 50
+):
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    
+    # $geoNear walks the 2dsphere index outward from the point and stops at
+    # radius_km, so only tasks inside the radius are filtered on status
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [lon, lat]},
+        "key": "location",
+        "distanceField": "distance_km",
+        "distanceMultiplier": 0.001,
+        "maxDistance": radius_km * 1000,
+        "spherical": True
+    }
+    if status:
+        geo_near["query"] = {"status": status}
+    
+    tasks = await db.tasks.aggregate([
+        {"$geoNear": geo_near},
+        {"$limit": min(max(limit, 1), 500)},
+        {"$project": {"_id": 0}}
+    ]).to_list(None)
+    return tasks
+
 @api_router.get("/tasks/{task_id}", response_model=Task)
 async def get_task(task_id: str):
     task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
@@ -287,6 +468,147 @@ async def get_task(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
+# Bar resolutions in seconds; trades write 1m bars, coarser ones are rolled up
+HISTORY_RESOLUTIONS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "4h": 14400, "1d": 86400}
+
+# Coarse bars are rebuilt from 1m bars every ROLLUP_INTERVAL seconds; the
+# first run after startup re-checks ROLLUP_REPAIR_WINDOW of history
+ROLLUP_INTERVAL = 60
+ROLLUP_REPAIR_WINDOW = timedelta(days=1)
+
+def _bucket_start(ts, seconds):
+    epoch = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc)
+
+def _bar_update(price, volume, ts):
+    # Pipeline update folding one trade into a bar. open/close follow the
+    # trade timestamps rather than write order, so concurrent or reordered
+    # writes to the same bucket converge on the same bar.
+    at = ts.isoformat(timespec="microseconds")
+    return [{"$set": {
+        "open": {"$cond": [{"$lt": [at, {"$ifNull": ["$open_at", "~"]}]}, price, "$open"]},
+        "open_at": {"$min": ["$open_at", at]},
+        "high": {"$max": ["$high", price]},
+        "low": {"$min": ["$low", price]},
+        "close": {"$cond": [{"$gte": [at, {"$ifNull": ["$close_at", ""]}]}, price, "$close"]},
+        "close_at": {"$max": ["$close_at", at]},
+        "volume": {"$add": [{"$ifNull": ["$volume", 0]}, volume]},
+        "trades": {"$add": [{"$ifNull": ["$trades", 0]}, 1]}
+    }}]
+
+async def _record_price(task_id, price, volume, ts):
+    start = _bucket_start(ts, HISTORY_RESOLUTIONS["1m"]).isoformat()
+    await db.price_bars.update_one(
+        {"task_id": task_id, "resolution": "1m", "start": start},
+        _bar_update(price, volume, ts),
+        upsert=True
+    )
+
+def _rollup_pipeline(resolution, task_ids, window_start):
+    # Group 1m bars into coarse buckets and $merge them over the stored
+    # coarse bars. Rebuilding from 1m bars makes the rollup idempotent, so
+    # a missed or repeated run repairs itself.
+    bucket_ms = HISTORY_RESOLUTIONS[resolution] * 1000
+    start_ms = {"$toLong": {"$dateFromString": {"dateString": "$start"}}}
+    return [
+        {"$match": {"resolution": "1m", "task_id": {"$in": task_ids}, "start": {"$gte": window_start}}},
+        {"$sort": {"start": 1}},
+        {"$group": {
+            "_id": {"task_id": "$task_id", "bucket": {"$subtract": [start_ms, {"$mod": [start_ms, bucket_ms]}]}},
+            "open": {"$first": "$open"},
+            "open_at": {"$first": "$open_at"},
+            "high": {"$max": "$high"},
+            "low": {"$min": "$low"},
+            "close": {"$last": "$close"},
+            "close_at": {"$last": "$close_at"},
+            "volume": {"$sum": "$volume"},
+            "trades": {"$sum": "$trades"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "task_id": "$_id.task_id",
+            "resolution": {"$literal": resolution},
+            # Same shape as _bucket_start(...).isoformat()
+            "start": {"$dateToString": {
+                "date": {"$toDate": "$_id.bucket"},
+                "format": "%Y-%m-%dT%H:%M:%S+00:00",
+                "timezone": "UTC"
+            }},
+            "open": 1, "open_at": 1, "high": 1, "low": 1,
+            "close": 1, "close_at": 1, "volume": 1, "trades": 1
+        }},
+        {"$merge": {
+            "into": "price_bars",
+            "on": ["task_id", "resolution", "start"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+async def rollup_price_history(since, batch_size=500):
+    # Rebuild every coarse bucket that overlaps [since, now) for the markets
+    # traded since then
+    task_ids = await db.price_bars.distinct(
+        "task_id",
+        {"resolution": "1m", "close_at": {"$gte": since.isoformat(timespec="microseconds")}}
+    )
+    for i in range(0, len(task_ids), batch_size):
+        batch = task_ids[i:i + batch_size]
+        for resolution, seconds in HISTORY_RESOLUTIONS.items():
+            if resolution == "1m":
+                continue
+            window_start = _bucket_start(since, seconds).isoformat()
+            await db.price_bars.aggregate(_rollup_pipeline(resolution, batch, window_start)).to_list(None)
+
+async def _acquire_lease(name, seconds):
+    # Cross-process lease so a periodic job runs in one worker at a time
+    now = datetime.now(timezone.utc)
+    try:
+        await db.leases.update_one(
+            {"_id": name, "until": {"$lt": now.isoformat()}},
+            {"$set": {"until": (now + timedelta(seconds=seconds)).isoformat()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def _run_migration(name, migrate, lease_seconds=3600):
+    # One-off data migration run in the background after startup. The lease
+    # keeps other workers out while it runs and the marker in db.migrations
+    # stops it from scanning again on later boots.
+    try:
+        if await db.migrations.find_one({"_id": name}):
+            return
+        if not await _acquire_lease(f"migration:{name}", lease_seconds):
+            return
+        await migrate()
+        await db.migrations.insert_one({"_id": name, "completed_at": datetime.now(timezone.utc).isoformat()})
+        logger.info(f"Migration {name} completed")
+    except Exception as e:
+        logger.warning(f"Migration {name} failed: {e}")
+
+async def _price_rollup_loop():
+    since = datetime.now(timezone.utc) - ROLLUP_REPAIR_WINDOW
+    while True:
+        started = datetime.now(timezone.utc)
+        try:
+            if await _acquire_lease("price_rollup", ROLLUP_INTERVAL - 5):
+                await rollup_price_history(since)
+                # Overlap one interval so late-committing trades are picked up
+                since = started - timedelta(seconds=ROLLUP_INTERVAL)
+        except Exception as e:
+            logger.warning(f"Price history rollup failed: {e}")
+        await asyncio.sleep(ROLLUP_INTERVAL)
+
+def _timestamp_param(value, name):
+    # Stored timestamps are UTC isoformat() strings; normalise "Z", offsets
+    # and naive query parameters so string comparison matches time order
+    try:
+        return normalize_timestamp(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} timestamp")
+
 @api_router.post("/tasks/{task_id}/trade")
 async def trade_market(task_id: str, trade: Trade):
     task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
@@ -301,17 +623,13 @@ async def trade_market(task_id: str, trade: Trade):
     
     # Update pools
     if trade.side == "yes":
-        await db.tasks.update_one(
-            {"id": task_id},
-            {"$inc": {"yes_pool": trade.amount, "yes_shares": shares}}
-        )
+        inc = {"yes_pool": trade.amount, "yes_shares": shares}
     else:
-        await db.tasks.update_one(
-            {"id": task_id},
-            {"$inc": {"no_pool": trade.amount, "no_shares": shares}}
-        )
+        inc = {"no_pool": trade.amount, "no_shares": shares}
     
-    # Record position
+    # Record position before bumping payout_version, so a payout computed
+    # from the new position is never cached under the old version
+    now = datetime.now(timezone.utc)
     position = Position(
         id=str(uuid.uuid4()),
         task_id=task_id,
@@ -319,17 +637,214 @@ async def trade_market(task_id: str, trade: Trade):
         side=trade.side,
         shares=shares,
         cost=trade.amount,
-        created_at=datetime.now(timezone.utc).isoformat()
+        created_at=now.isoformat()
     )
     await db.positions.insert_one(position.model_dump())
+    inc["payout_version"] = 1
+    task = await db.tasks.find_one_and_update(
+        {"id": task_id},
+        {"$inc": inc},
+        projection={"_id": 0, "yes_pool": 1, "no_pool": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    # Append to price history; coarser bars are rolled up by _price_rollup_loop
+    total_pool = task["yes_pool"] + task["no_pool"]
+    price = task["yes_pool"] / total_pool if total_pool > 0 else 0.5
+    await _record_price(task_id, price, trade.amount, now)
     
     return {"message": "Trade executed", "shares": shares, "side": trade.side}
 
+@api_router.get("/tasks/{task_id}/history", response_model=List[PriceBar])
+async def get_task_history(
+    task_id: str,
+    resolution: str = "1m",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 500
+):
+    if resolution not in HISTORY_RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported resolution. Use one of: {', '.join(HISTORY_RESOLUTIONS)}"
+        )
+    
+    query = {"task_id": task_id, "resolution": resolution}
+    if start or end:
+        query["start"] = {}
+        if start:
+            query["start"]["$gte"] = _timestamp_param(start, "start")
+        if end:
+            query["start"]["$lt"] = _timestamp_param(end, "end")
+    
+    # Newest bars first for the limit, returned in chronological order
+    bars = await db.price_bars.find(query, {"_id": 0}).sort("start", -1).to_list(min(max(limit, 1), 5000))
+    bars.reverse()
+    return bars
+
 @api_router.get("/tasks/{task_id}/positions", response_model=List[Position])
 async def get_task_positions(task_id: str):
     positions = await db.positions.find({"task_id": task_id}, {"_id": 0}).to_list(1000)
     return positions
 
+# ===== PAYOUTS =====
+def _payout_stages():
+    # Positions grouped per (task, user) with the market joined as "market";
+    # pro-rata payout = shares / side shares * total pool
+    def pro_rata(shares, side_shares):
+        return {"$cond": [
+            {"$gt": [side_shares, 0]},
+            {"$multiply": [{"$divide": [shares, side_shares]}, "$total_pool"]},
+            0.0
+        ]}
+    
+    def on_resolution(if_yes, if_no):
+        return {"$cond": [
+            {"$eq": ["$market.status", "resolved"]},
+            {"$cond": ["$market.success", if_yes, if_no]},
+            None
+        ]}
+    
+    return [
+        {"$addFields": {"total_pool": {"$add": ["$market.yes_pool", "$market.no_pool"]}}},
+        {"$project": {
+            "_id": 0,
+            "task_id": "$_id.task_id",
+            "user": "$_id.user",
+            "status": "$market.status",
+            "yes_shares": 1,
+            "no_shares": 1,
+            "cost": 1,
+            "unredeemed_positions": 1,
+            "payout_if_yes": pro_rata("$yes_shares", "$market.yes_shares"),
+            "payout_if_no": pro_rata("$no_shares", "$market.no_shares"),
+            "final_payout": on_resolution(
+                pro_rata("$yes_shares", "$market.yes_shares"),
+                pro_rata("$no_shares", "$market.no_shares")
+            ),
+            "claimable": on_resolution(
+                pro_rata("$unredeemed_yes", "$market.yes_shares"),
+                pro_rata("$unredeemed_no", "$market.no_shares")
+            )
+        }}
+    ]
+
+def _group_positions_stage():
+    def shares_where(condition):
+        return {"$sum": {"$cond": [condition, "$shares", 0]}}
+    
+    is_yes = {"$eq": ["$side", "yes"]}
+    is_no = {"$ne": ["$side", "yes"]}
+    unredeemed = {"$ne": ["$redeemed", True]}
+    return {"$group": {
+        "_id": {"task_id": "$task_id", "user": "$user"},
+        "yes_shares": shares_where(is_yes),
+        "no_shares": shares_where(is_no),
+        "unredeemed_yes": shares_where({"$and": [is_yes, unredeemed]}),
+        "unredeemed_no": shares_where({"$and": [is_no, unredeemed]}),
+        "unredeemed_positions": {"$sum": {"$cond": [unredeemed, 1, 0]}},
+        "cost": {"$sum": "$cost"}
+    }}
+
+MARKET_PAYOUT_FIELDS = {"_id": 0, "id": 1, "status": 1, "success": 1, "payout_version": 1,
+                        "yes_pool": 1, "no_pool": 1, "yes_shares": 1, "no_shares": 1}
+
+async def _market_payouts(task, user=None):
+    match = {"task_id": task["id"]}
+    if user is not None:
+        match["user"] = user
+    market = {field: task.get(field) for field in MARKET_PAYOUT_FIELDS if field != "_id"}
+    return await db.positions.aggregate([
+        {"$match": match},
+        _group_positions_stage(),
+        {"$addFields": {"market": {"$literal": market}}},
+        *_payout_stages(),
+        {"$sort": {"user": 1}}
+    ]).to_list(None)
+
+async def _user_payouts(user):
+    return await db.positions.aggregate([
+        {"$match": {"user": user}},
+        _group_positions_stage(),
+        {"$lookup": {
+            "from": "tasks",
+            "localField": "_id.task_id",
+            "foreignField": "id",
+            "as": "market"
+        }},
+        {"$unwind": "$market"},
+        *_payout_stages(),
+        {"$sort": {"task_id": 1}}
+    ]).to_list(None)
+
+class _TTLCache:
+    # Small in-process LRU with a TTL. Payout entries are keyed on the
+    # payout_version of every market they cover, so a trade, resolution or
+    # redemption in any worker changes the key; the TTL only bounds how long
+    # superseded entries linger.
+    def __init__(self, max_entries=10000, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+    
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+payout_cache = _TTLCache()
+
+async def _user_payout_versions(user):
+    task_ids = await db.positions.distinct("task_id", {"user": user})
+    tasks = await db.tasks.find(
+        {"id": {"$in": task_ids}}, {"_id": 0, "id": 1, "payout_version": 1}
+    ).to_list(None)
+    return tuple(sorted((t["id"], t.get("payout_version", 0)) for t in tasks))
+
+@api_router.get("/tasks/{task_id}/payouts", response_model=List[PayoutEntry])
+async def get_task_payouts(task_id: str):
+    task = await db.tasks.find_one({"id": task_id}, MARKET_PAYOUT_FIELDS)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    key = ("task", task_id, task.get("payout_version", 0))
+    payouts = payout_cache.get(key)
+    if payouts is None:
+        payouts = await _market_payouts(task)
+        payout_cache.put(key, payouts)
+    return payouts
+
+@api_router.get("/users/{user}/payouts", response_model=UserPayouts)
+async def get_user_payouts(user: str):
+    # A new market for the user or a change to any of them changes the key
+    key = ("user", user, await _user_payout_versions(user))
+    cached = payout_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    markets = await _user_payouts(user)
+    result = {
+        "user": user,
+        "total_cost": sum(m["cost"] for m in markets),
+        "total_final_payout": sum(m["final_payout"] or 0.0 for m in markets),
+        "total_claimable": sum(m["claimable"] or 0.0 for m in markets),
+        "markets": markets
+    }
+    payout_cache.put(key, result)
+    return result
+
 @api_router.post("/tasks/{task_id}/redeem")
 async def redeem_position(task_id: str, user: str):
     task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
@@ -340,32 +855,17 @@ async def redeem_position(task_id: str, user: str):
         raise HTTPException(status_code=400, detail="Task not resolved yet")
     
     # Find user positions
-    positions = await db.positions.find(
-        {"task_id": task_id, "user": user, "redeemed": False},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    if not positions:
+    payouts = await _market_payouts(task, user=user)
+    if not payouts or payouts[0]["unredeemed_positions"] == 0:
         raise HTTPException(status_code=404, detail="No positions to redeem")
     
-    total_payout = 0.0
+    total_payout = payouts[0]["claimable"]
     winning_side = "yes" if task["success"] else "no"
-    total_pool = task["yes_pool"] + task["no_pool"]
-    
-    for pos in positions:
-        if pos["side"] == winning_side:
-            if winning_side == "yes" and task["yes_shares"] > 0:
-                payout = (pos["shares"] / task["yes_shares"]) * total_pool
-            elif winning_side == "no" and task["no_shares"] > 0:
-                payout = (pos["shares"] / task["no_shares"]) * total_pool
-            else:
-                payout = 0.0
-            
-            total_payout += payout
-            await db.positions.update_one(
-                {"id": pos["id"]},
-                {"$set": {"redeemed": True}}
-            )
+    await db.positions.update_many(
+        {"task_id": task_id, "user": user, "side": winning_side, "redeemed": False},
+        {"$set": {"redeemed": True}}
+    )
+    await db.tasks.update_one({"id": task_id}, {"$inc": {"payout_version": 1}})
     
     return {"message": "Positions redeemed", "payout": total_payout, "user": user}
 
@@ -410,45 +910,179 @@ async def delete_task(task_id: str):
     return {"message": "Task deleted", "task_id": task_id}
 
 # ===== OPTIMIZER =====
-@api_router.post("/optimizer/optimize", response_model=OptimizeResult)
-async def optimize_task(input: OptimizeRequest):
-    task = await db.tasks.find_one({"id": input.task_id}, {"_id": 0})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+def _haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+def _euclidean(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+# Vectorised distances from point i to every point, for the O(n^2) steps
+def _haversine_km_row(coords, i):
+    lat, lon = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    h = np.sin((lat - lat[i]) / 2) ** 2 + np.cos(lat[i]) * np.cos(lat) * np.sin((lon - lon[i]) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+def _euclidean_row(coords, i):
+    return np.hypot(coords[:, 0] - coords[i, 0], coords[:, 1] - coords[i, 1])
+
+DISTANCE_ROWS = {_haversine_km: _haversine_km_row, _euclidean: _euclidean_row}
+
+def _route_points(waypoints):
+    # Returns (points, distance_fn) when every waypoint carries coordinates,
+    # either lat/lon (great-circle km) or planar x/y; otherwise (None, None)
+    if not waypoints:
+        return None, None
+    if all("lat" in wp and ("lon" in wp or "lng" in wp) for wp in waypoints):
+        keys, dist = ("lat", "lon"), _haversine_km
+    elif all("x" in wp and "y" in wp for wp in waypoints):
+        keys, dist = ("x", "y"), _euclidean
+    else:
+        return None, None
+    try:
+        points = [
+            (float(wp[keys[0]]), float(wp[keys[1]] if keys[1] in wp else wp["lng"]))
+            for wp in waypoints
+        ]
+    except (TypeError, ValueError):
+        # Non-numeric coordinates: treat the task as having none
+        return None, None
+    if not all(math.isfinite(a) and math.isfinite(b) for a, b in points):
+        return None, None
+    return points, dist
+
+def _path_length(points, order, dist):
+    return sum(dist(points[order[k]], points[order[k + 1]]) for k in range(len(order) - 1))
+
+def _mst_length(points, dist):
+    # Prim's algorithm; the MST weight is a lower bound on any open route
+    n = len(points)
+    if n < 2:
+        return 0.0
+    coords = np.asarray(points, dtype=float)
+    row = DISTANCE_ROWS[dist]
+    used = np.zeros(n, dtype=bool)
+    used[0] = True
+    best = row(coords, 0)
+    best[used] = np.inf
+    total = 0.0
+    for _ in range(n - 1):
+        u = int(np.argmin(best))
+        total += float(best[u])
+        used[u] = True
+        best = np.minimum(best, row(coords, u))
+        best[used] = np.inf
+    return total
+
+async def _anytime_route(points, dist, deadline, min_interval=0.25):
+    # Input order first, then nearest-neighbour construction from the first
+    # waypoint, then 2-opt improvement until no move helps or the deadline
+    # passes. Yields (order, length) for improved routes, at most once per
+    # min_interval seconds during 2-opt, and always the final best route if
+    # it was not yet yielded. Every route starts at waypoint 0.
+    n = len(points)
+    order = list(range(n))
+    length = _path_length(points, order, dist)
+    yield list(order), length
     
-    # Mock classical optimization (simple greedy TSP)
-    waypoints = task["waypoints"]
+    # Yield to the event loop every few insertions; if the deadline passes
+    # mid-way the remaining waypoints keep their input order
+    coords = np.asarray(points, dtype=float)
+    row = DISTANCE_ROWS[dist]
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    nearest = [0]
+    while len(nearest) < n:
+        if len(nearest) % 64 == 0:
+            await asyncio.sleep(0)
+            if time.monotonic() >= deadline:
+                nearest.extend(int(i) for i in np.flatnonzero(~visited))
+                break
+        distances = row(coords, nearest[-1])
+        distances[visited] = np.inf
+        nxt = int(np.argmin(distances))
+        visited[nxt] = True
+        nearest.append(nxt)
+    nearest_length = _path_length(points, nearest, dist)
+    if nearest_length < length - 1e-9:
+        order, length = nearest, nearest_length
+        yield list(order), length
+    last_yield = time.monotonic()
+    pending = False
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if pending and now - last_yield >= min_interval:
+                yield list(order), length
+                last_yield = time.monotonic()
+                pending = False
+            a = points[order[i - 1]]
+            b = points[order[i]]
+            for j in range(i + 1, n):
+                c = points[order[j]]
+                delta = dist(a, c) - dist(a, b)
+                if j + 1 < n:
+                    d = points[order[j + 1]]
+                    delta += dist(b, d) - dist(c, d)
+                if delta < -1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    length += delta
+                    improved = pending = True
+                    b = points[order[i]]
+            # Let other requests run between rows of the neighbourhood scan
+            await asyncio.sleep(0)
+
+    if pending:
+        yield list(order), length
+
+def _build_plan(waypoints, order):
     plan = []
-    
-    if waypoints:
-        # Create a simple route visiting all waypoints
-        for i, wp in enumerate(waypoints):
-            plan.append({
-                "step": i + 1,
-                "waypoint": wp,
-                "estimated_time": random.randint(5, 20),
-                "action": wp.get("action", "visit")
-            })
-    
-    # Mock optimization score
-    score = random.uniform(85.0, 98.0)
-    
+    for step, idx in enumerate(order):
+        wp = waypoints[idx]
+        plan.append({
+            "step": step + 1,
+            "waypoint": wp,
+            "estimated_time": random.randint(5, 20),
+            "action": wp.get("action", "visit")
+        })
+    return plan
+
+def _solution_uri(plan):
     # Mock IPFS upload
-    solution_uri = f"ipfs://Qm{hashlib.sha256(str(plan).encode()).hexdigest()[:44]}"
+    return f"ipfs://Qm{hashlib.sha256(str(plan).encode()).hexdigest()[:44]}"
+
+async def _store_solution(task_id, plan, score, length):
+    # Only replace the stored solution with a shorter route. Without
+    # coordinates (length None) there is no route to compare, so a new mock
+    # solution only replaces another mock one.
+    solution_uri = _solution_uri(plan)
     
-    # Update task with solution
-    await db.tasks.update_one(
-        {"id": input.task_id},
+    query = {"id": task_id, "route_length": None}
+    if length is not None:
+        query = {"id": task_id, "$or": [
+            {"route_length": None},
+            {"route_length": {"$gt": length}}
+        ]}
+    result = await db.tasks.update_one(
+        query,
         {"$set": {
             "solution_uri": solution_uri,
-            "optimization_score": score
+            "optimization_score": score,
+            "route_length": length
         }}
     )
-    
-    # Submit to blockchain (if connected)
+    return solution_uri, result.modified_count > 0
+
+def _submit_solution_onchain(task_id, solution_uri, score):
     if web3_service and web3_service.is_connected():
         try:
-            task_id_bytes = bytes.fromhex(input.task_id.replace('-', ''))
+            task_id_bytes = bytes.fromhex(task_id.replace('-', ''))
             web3_service.submit_optimization_result(
                 task_id_bytes,
                 solution_uri,
@@ -456,6 +1090,73 @@ async def optimize_task(input: OptimizeRequest):
             )
         except Exception as e:
             print(f"⚠️  Could not submit to blockchain: {e}")
+
+# Seconds of route search behind the blocking /optimizer/optimize endpoint
+OPTIMIZE_TIME_BUDGET = 1.0
+
+# The MST is about 0.9x the optimal route on typical waypoint sets, so the
+# bound is scaled by this to put a well-optimised route near 100
+MST_TO_OPTIMAL_RATIO = 0.9
+
+# Below this many waypoints the bound is cheap enough to compute before the
+# first route, so every update carries a score
+MST_INLINE_MAX_POINTS = 1000
+
+async def _mock_solutions(waypoints):
+    # No coordinates to search over: a single mock solution in input order
+    yield list(range(len(waypoints))), None, random.uniform(85.0, 98.0)
+
+def _route_score(lower_bound, length):
+    # Estimated optimal length as a percentage of the route length
+    if length <= 0:
+        return 100.0
+    return min(100.0, 100.0 * lower_bound / (MST_TO_OPTIMAL_RATIO * length))
+
+async def _scored_routes(points, dist, deadline):
+    # Yields (order, length, score). For large inputs the bound is computed
+    # in a worker thread while the search runs; routes found before it is
+    # ready are yielded with a score of None, and the final route is always
+    # re-yielded with its score.
+    if len(points) <= MST_INLINE_MAX_POINTS:
+        bound = asyncio.get_running_loop().create_future()
+        bound.set_result(_mst_length(points, dist))
+    else:
+        bound = asyncio.ensure_future(asyncio.to_thread(_mst_length, points, dist))
+    last = None
+    async for order, length in _anytime_route(points, dist, deadline):
+        score = _route_score(bound.result(), length) if bound.done() else None
+        last = (order, length, score)
+        yield last
+    if last is not None and last[2] is None:
+        yield last[0], last[1], _route_score(await bound, last[1])
+
+def _solutions(waypoints, deadline):
+    points, dist = _route_points(waypoints)
+    if points is None:
+        return _mock_solutions(waypoints)
+    return _scored_routes(points, dist, deadline)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.post("/optimizer/optimize", response_model=OptimizeResult)
+async def optimize_task(input: OptimizeRequest):
+    task = await db.tasks.find_one({"id": input.task_id}, {"_id": 0})
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    # Same search and scoring as the stream, with a short budget
+    waypoints = task["waypoints"]
+    async for order, length, score in _solutions(waypoints, time.monotonic() + OPTIMIZE_TIME_BUDGET):
+        pass
+    plan = _build_plan(waypoints, order)
+    
+    # Update task with solution
+    solution_uri, stored = await _store_solution(input.task_id, plan, score, length)
+    
+    # Submit to blockchain (if connected)
+    if stored:
+        _submit_solution_onchain(input.task_id, solution_uri, score)
     
     result = OptimizeResult(
         task_id=input.task_id,
@@ -466,6 +1167,58 @@ async def optimize_task(input: OptimizeRequest):
     
     return result
 
+@api_router.post("/optimizer/optimize/stream")
+async def optimize_task_stream(input: AnytimeOptimizeRequest, request: Request):
+    task = await db.tasks.find_one({"id": input.task_id}, {"_id": 0})
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    waypoints = task["waypoints"]
+    
+    async def events():
+        started = time.monotonic()
+        best = last = None
+        
+        async for order, length, score in _solutions(waypoints, started + input.time_budget):
+            plan = _build_plan(waypoints, order)
+            last = {
+                "task_id": input.task_id,
+                "solution_uri": _solution_uri(plan),
+                "score": score,  # None until the lower bound is ready (large inputs)
+                "route_length": length,
+                "stored": False,
+                "plan": plan,
+                "elapsed": time.monotonic() - started
+            }
+            if score is not None:
+                # Persist routes shorter than the stored one so an early
+                # disconnect keeps the best route
+                _, last["stored"] = await _store_solution(input.task_id, plan, score, length)
+                if last["stored"]:
+                    best = last
+            if await request.is_disconnected():
+                break
+            yield _sse("solution", last)
+        
+        if best is not None:
+            _submit_solution_onchain(input.task_id, best["solution_uri"], best["score"])
+        if last is not None:
+            final = best or last
+            yield _sse("done", {
+                "task_id": input.task_id,
+                "solution_uri": final["solution_uri"],
+                "score": final["score"],
+                "route_length": final["route_length"],
+                "stored": best is not None,
+                "elapsed": time.monotonic() - started
+            })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ===== ORACLE =====
 @api_router.post("/oracle/verify", response_model=VerifyResult)
 async def verify_task(input: VerifyRequest):
@@ -484,11 +1237,14 @@ async def verify_task(input: VerifyRequest):
     # Update task status
     await db.tasks.update_one(
         {"id": input.task_id},
-        {"$set": {
-            "status": "resolved",
-            "success": success,
-            "evidence_uri": input.evidence_uri
-        }}
+        {
+            "$set": {
+                "status": "resolved",
+                "success": success,
+                "evidence_uri": input.evidence_uri
+            },
+            "$inc": {"payout_version": 1}
+        }
     )
     
     # Update robot reputation
@@ -522,15 +1278,136 @@ async def verify_task(input: VerifyRequest):
     return result
 
 # ===== DAO =====
+async def _snapshot_voting_weights(proposal_id):
+    # Voting weight per owner = sum of stake * reputation / 100 over active robots,
+    # materialised server-side once per proposal
+    await db.robots.aggregate([
+        {"$match": {"active": True, "stake": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$owner",
+            "weight": {"$sum": {"$multiply": [
+                "$stake",
+                {"$divide": [{"$max": ["$reputation", 0]}, 100]}
+            ]}}
+        }},
+        {"$match": {"weight": {"$gt": 0}}},
+        {"$project": {
+            "_id": 0,
+            "proposal_id": {"$literal": proposal_id},
+            "voter": "$_id",
+            "weight": 1
+        }},
+        {"$merge": {
+            "into": "vote_weights",
+            "on": ["proposal_id", "voter"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]).to_list(None)
+    
+    totals = await db.vote_weights.aggregate([
+        {"$match": {"proposal_id": proposal_id}},
+        {"$group": {"_id": None, "total": {"$sum": "$weight"}}}
+    ]).to_list(1)
+    return totals[0]["total"] if totals else 0.0
+
+def _tally_delta(previous, support, weight):
+    # $inc to apply to the proposal when a voter (re)casts a ballot
+    side = "yes_votes" if support else "no_votes"
+    if previous is None:
+        return {side: weight, "voters": 1}
+    if previous["support"] == support:
+        return {}
+    old_side = "yes_votes" if previous["support"] else "no_votes"
+    return {old_side: -previous["weight"], side: weight}
+
+async def _get_active_proposal(proposal_id):
+    proposal = await db.proposals.find_one({"id": proposal_id}, {"_id": 0})
+    if not proposal:
+        raise HTTPException(status_code=404, detail="Proposal not found")
+    
+    if proposal["status"] != "active":
+        raise HTTPException(status_code=400, detail="Proposal not active")
+    return proposal
+
+async def _ensure_snapshot(proposal):
+    # Proposals created before weight snapshots existed get one on first vote
+    if "total_weight" in proposal:
+        return
+    total_weight = await _snapshot_voting_weights(proposal["id"])
+    await db.proposals.update_one(
+        {"id": proposal["id"], "total_weight": {"$exists": False}},
+        {"$set": {"total_weight": total_weight}}
+    )
+
+async def _apply_ballots(proposal_id, ballots, weights, now):
+    # Write one batch of ballots and count the ones that landed. Each upsert
+    # only matches the ballot state the tally delta was computed from; if a
+    # concurrent vote changed it, the upsert collides with the unique
+    # (proposal_id, voter) index and the voter is returned for a recount.
+    previous = {
+        doc["voter"]: doc
+        async for doc in db.votes.find(
+            {"proposal_id": proposal_id, "voter": {"$in": list(ballots)}},
+            {"_id": 0, "voter": 1, "support": 1, "weight": 1}
+        )
+    }
+    
+    ops, deltas = [], []
+    recorded = 0
+    for voter, support in ballots.items():
+        prev = previous.get(voter)
+        delta = _tally_delta(prev, support, weights[voter])
+        if not delta:
+            recorded += 1  # unchanged ballot
+            continue
+        expected = {"$exists": False} if prev is None else prev["support"]
+        ops.append(UpdateOne(
+            {"proposal_id": proposal_id, "voter": voter, "support": expected},
+            {"$set": {"support": support, "weight": weights[voter], "updated_at": now}},
+            upsert=True
+        ))
+        deltas.append((voter, delta))
+    if not ops:
+        return recorded, []
+    
+    failed = {}
+    error = None
+    try:
+        await db.votes.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"]: err["code"] for err in e.details.get("writeErrors", [])}
+        if any(code != 11000 for code in failed.values()):
+            error = e
+    
+    totals = {}
+    conflicts = []
+    for index, (voter, delta) in enumerate(deltas):
+        if index in failed:
+            if failed[index] == 11000:
+                conflicts.append(voter)
+            continue
+        recorded += 1
+        for field, amount in delta.items():
+            totals[field] = totals.get(field, 0) + amount
+    # Count what was written before surfacing any other write error
+    if totals:
+        await db.proposals.update_one({"id": proposal_id}, {"$inc": totals})
+    if error is not None:
+        raise error
+    return recorded, conflicts
+
 @api_router.post("/dao/propose", response_model=Proposal)
 async def create_proposal(input: ProposalCreate):
     proposal_id = str(uuid.uuid4())
+    total_weight = await _snapshot_voting_weights(proposal_id)
     proposal = Proposal(
         id=proposal_id,
         title=input.title,
         description=input.description,
         action=input.action,
         proposer="user_" + str(uuid.uuid4())[:8],
+        total_weight=total_weight,
         created_at=datetime.now(timezone.utc).isoformat()
     )
     
@@ -544,37 +1421,82 @@ async def list_proposals():
 
 @api_router.post("/dao/vote")
 async def vote_proposal(vote: Vote):
-    proposal = await db.proposals.find_one({"id": vote.proposal_id}, {"_id": 0})
-    if not proposal:
-        raise HTTPException(status_code=404, detail="Proposal not found")
+    await _ensure_snapshot(await _get_active_proposal(vote.proposal_id))
     
-    if proposal["status"] != "active":
-        raise HTTPException(status_code=400, detail="Proposal not active")
+    snapshot = await db.vote_weights.find_one(
+        {"proposal_id": vote.proposal_id, "voter": vote.voter},
+        {"_id": 0, "weight": 1}
+    )
+    if not snapshot:
+        raise HTTPException(status_code=403, detail="Voter has no voting weight for this proposal")
+    weight = snapshot["weight"]
+    
+    # One ballot per voter; re-voting replaces the earlier ballot
+    previous = await db.votes.find_one_and_update(
+        {"proposal_id": vote.proposal_id, "voter": vote.voter},
+        {"$set": {
+            "support": vote.support,
+            "weight": weight,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        projection={"_id": 0, "support": 1, "weight": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
     
     # Update vote counts
-    if vote.support:
-        await db.proposals.update_one(
-            {"id": vote.proposal_id},
-            {"$inc": {"yes_votes": vote.weight}}
-        )
-    else:
-        await db.proposals.update_one(
-            {"id": vote.proposal_id},
-            {"$inc": {"no_votes": vote.weight}}
-        )
+    delta = _tally_delta(previous, vote.support, weight)
+    if delta:
+        await db.proposals.update_one({"id": vote.proposal_id}, {"$inc": delta})
     
-    return {"message": "Vote recorded", "proposal_id": vote.proposal_id}
+    return {"message": "Vote recorded", "proposal_id": vote.proposal_id, "weight": weight}
+
+@api_router.post("/dao/proposals/{proposal_id}/votes/bulk")
+async def bulk_vote_proposal(
+    proposal_id: str,
+    ballots: BulkVote,
+    batch_size: int = Query(1000, ge=1, le=10000)
+):
+    await _ensure_snapshot(await _get_active_proposal(proposal_id))
+    
+    # Last ballot per voter wins within the request
+    latest = {entry.voter: entry.support for entry in ballots.votes}
+    voters = list(latest)
+    now = datetime.now(timezone.utc).isoformat()
+    recorded = 0
+    conflicted = 0
+    
+    for i in range(0, len(voters), batch_size):
+        batch = voters[i:i + batch_size]
+        weights = {
+            doc["voter"]: doc["weight"]
+            async for doc in db.vote_weights.find(
+                {"proposal_id": proposal_id, "voter": {"$in": batch}},
+                {"_id": 0, "voter": 1, "weight": 1}
+            )
+        }
+        pending = {voter: latest[voter] for voter in weights}
+        for _ in range(3):
+            written, conflicts = await _apply_ballots(proposal_id, pending, weights, now)
+            recorded += written
+            pending = {voter: latest[voter] for voter in conflicts}
+            if not pending:
+                break
+        conflicted += len(pending)
+    
+    return {
+        "message": "Votes recorded",
+        "proposal_id": proposal_id,
+        "recorded": recorded,
+        "conflicted": conflicted,
+        "rejected": len(voters) - recorded - conflicted
+    }
 
 @api_router.post("/dao/execute/{proposal_id}")
 async def execute_proposal(proposal_id: str):
-    proposal = await db.proposals.find_one({"id": proposal_id}, {"_id": 0})
-    if not proposal:
-        raise HTTPException(status_code=404, detail="Proposal not found")
+    proposal = await _get_active_proposal(proposal_id)
     
-    if proposal["status"] != "active":
-        raise HTTPException(status_code=400, detail="Proposal not active")
-    
-    # Check if passed (simple majority)
+    # Check if passed (simple majority of snapshot-weighted tallies)
     if proposal["yes_votes"] > proposal["no_votes"]:
         await db.proposals.update_one(
             {"id": proposal_id},
@@ -598,19 +1520,15 @@ async def delete_proposal(proposal_id: str):
     if proposal["yes_votes"] > 0 or proposal["no_votes"] > 0:
         raise HTTPException(status_code=400, detail="Cannot delete proposal with existing votes")
     
-    # Hard delete
+    # Hard delete, including the weight snapshot
     await db.proposals.delete_one({"id": proposal_id})
+    await db.vote_weights.delete_many({"proposal_id": proposal_id})
     
     return {"message": "Proposal deleted", "proposal_id": proposal_id}
 
 @api_router.post("/dao/proposals/{proposal_id}/withdraw")
 async def withdraw_proposal(proposal_id: str):
-    proposal = await db.proposals.find_one({"id": proposal_id}, {"_id": 0})
-    if not proposal:
-        raise HTTPException(status_code=404, detail="Proposal not found")
-    
-    if proposal["status"] != "active":
-        raise HTTPException(status_code=400, detail="Proposal not active")
+    proposal = await _get_active_proposal(proposal_id)
     
     # Check if majority votes to withdraw
     total_votes = proposal["yes_votes"] + proposal["no_votes"]
@@ -627,6 +1545,36 @@ async def withdraw_proposal(proposal_id: str):
     
     return {"message": "Proposal withdrawn", "proposal_id": proposal_id}
 
+# ===== EXPORT =====
+@api_router.get("/export/{collection}")
+async def export_collection(
+    collection: str,
+    format: str = "csv",
+    since: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+):
+    if collection not in EXPORT_SCHEMAS:
+        raise HTTPException(status_code=404, detail="Unknown collection")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if not format_available(format):
+        raise HTTPException(status_code=400, detail=f"{format} export requires pyarrow")
+    
+    if since:
+        since = _timestamp_param(since, "since")
+    
+    # Rows up to the watermark are exported; pass it back as `since` next run
+    watermark = export_watermark()
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_export(db, collection, format, since, watermark, min(max(batch_size, 1), 50000)),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{collection}.{extension}"',
+            "X-Export-Watermark": watermark
+        }
+    )
+
 # ===== IPFS MOCK =====
 @api_router.post("/ipfs/upload", response_model=IPFSResult)
 async def upload_to_ipfs(input: IPFSUpload):
@@ -653,6 +1601,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Periodic jobs started with the app and cancelled on shutdown
+background_jobs = []
+
+@app.on_event("startup")
+async def create_indexes():
+    await db.price_bars.create_index(
+        [("task_id", ASCENDING), ("resolution", ASCENDING), ("start", ASCENDING)],
+        unique=True
+    )
+    await db.price_bars.create_index([("resolution", ASCENDING), ("close_at", ASCENDING)])
+    await db.tasks.create_index([("location", GEOSPHERE), ("status", ASCENDING)])
+    await db.tasks.create_index("id")
+    await db.positions.create_index([("task_id", ASCENDING), ("user", ASCENDING)])
+    await db.positions.create_index([("user", ASCENDING), ("task_id", ASCENDING)])
+    for collection in EXPORT_SCHEMAS:
+        await db[collection].create_index("created_at")
+    for keys in ROBOT_SEARCH_INDEXES:
+        await db.robots.create_index(keys)
+    for collection in (db.vote_weights, db.votes):
+        await collection.create_index(
+            [("proposal_id", ASCENDING), ("voter", ASCENDING)],
+            unique=True
+        )
+    background_jobs.append(asyncio.create_task(
+        _run_migration("task_locations", _backfill_task_locations)
+    ))
+    background_jobs.append(asyncio.create_task(_price_rollup_loop()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for job in background_jobs:
+        job.cancel()
     client.close()
\ No newline at end of file
@@ -128,7 +128,7 @@ const RobotsPage = () => {
   const [deleteDialog, setDeleteDialog] = useState({ open: false, robotId: null });
   
   // Web3 hooks
-  const { isConnected } = useIsConnected();
+  const { isConnected, address } = useIsConnected();
   const { registerRobot, isPending, isConfirming, isSuccess, hash } = useRegisterRobot();
 
   useEffect(() => {
@@ -182,7 +182,8 @@ const RobotsPage = () => {
         name: formData.name,
         description: formData.description,
         capabilities,
-        stake_amount: parseFloat(formData.stake_amount)
+        stake_amount: parseFloat(formData.stake_amount),
+        owner: address
       });
       
     } catch (e) {
@@ -1046,7 +1047,7 @@ const DAOPage = () => {
   const [withdrawDialog, setWithdrawDialog] = useState({ open: false, proposalId: null });
   
   // Web3 hooks
-  const { isConnected } = useIsConnected();
+  const { isConnected, address } = useIsConnected();
   const voteHook = useVoteOnProposal();
 
   useEffect(() => {
@@ -1101,8 +1102,8 @@ const DAOPage = () => {
       // Also save to backend
       await axios.post(`${API}/dao/vote`, {
         proposal_id: proposalId,
-        support,
-        weight: 1.0
+        voter: address,
+        support
       });
       
     } catch (e) {
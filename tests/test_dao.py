@@ -0,0 +1,100 @@
+import asyncio
+
+from pymongo.errors import BulkWriteError
+
+import server
+
+
+def test_tally_delta_first_vote_counts_voter():
+    assert server._tally_delta(None, True, 5.0) == {"yes_votes": 5.0, "voters": 1}
+    assert server._tally_delta(None, False, 2.5) == {"no_votes": 2.5, "voters": 1}
+
+
+def test_tally_delta_same_vote_is_noop():
+    assert server._tally_delta({"support": True, "weight": 5.0}, True, 5.0) == {}
+
+
+def test_tally_delta_switching_moves_weight():
+    assert server._tally_delta({"support": True, "weight": 5.0}, False, 5.0) == {
+        "yes_votes": -5.0,
+        "no_votes": 5.0,
+    }
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Votes:
+    def __init__(self, existing, failed_indexes=()):
+        self.existing = existing
+        self.failed_indexes = failed_indexes
+        self.ops = []
+
+    def find(self, query, projection):
+        return _Cursor([doc for doc in self.existing if doc["voter"] in query["voter"]["$in"]])
+
+    async def bulk_write(self, ops, ordered):
+        self.ops = ops
+        if self.failed_indexes:
+            raise BulkWriteError({"writeErrors": [
+                {"index": index, "code": 11000} for index in self.failed_indexes
+            ]})
+
+
+class _Proposals:
+    def __init__(self):
+        self.incs = []
+
+    async def update_one(self, query, update):
+        self.incs.append(update["$inc"])
+
+
+class _DB:
+    def __init__(self, votes):
+        self.votes = votes
+        self.proposals = _Proposals()
+
+
+def test_apply_ballots_counts_written_ballots_and_returns_conflicts(monkeypatch):
+    votes = _Votes(
+        existing=[{"voter": "bob", "support": True, "weight": 2.0}],
+        failed_indexes=[1],
+    )
+    fake_db = _DB(votes)
+    monkeypatch.setattr(server, "db", fake_db)
+
+    recorded, conflicts = asyncio.run(server._apply_ballots(
+        "p1", {"alice": True, "bob": False}, {"alice": 3.0, "bob": 2.0}, "now"
+    ))
+
+    # Each upsert is conditional on the ballot state the delta came from
+    filters = [op._filter for op in votes.ops]
+    assert filters[0]["support"] == {"$exists": False}
+    assert filters[1]["support"] is True
+    # bob's ballot collided with a concurrent vote: not counted, sent back
+    assert recorded == 1
+    assert conflicts == ["bob"]
+    assert fake_db.proposals.incs == [{"yes_votes": 3.0, "voters": 1}]
+
+
+def test_apply_ballots_skips_unchanged_ballots(monkeypatch):
+    votes = _Votes(existing=[{"voter": "bob", "support": True, "weight": 2.0}])
+    fake_db = _DB(votes)
+    monkeypatch.setattr(server, "db", fake_db)
+
+    recorded, conflicts = asyncio.run(server._apply_ballots("p1", {"bob": True}, {"bob": 2.0}, "now"))
+
+    assert (recorded, conflicts) == (1, [])
+    assert votes.ops == []
+    assert fake_db.proposals.incs == []
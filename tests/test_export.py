@@ -0,0 +1,76 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+
+import pyarrow as pa
+import pytest
+import pyarrow.parquet as pq
+
+import export_service
+
+DOCS = [
+    {"id": str(i), "task_id": "t1", "user": f"user_{i % 3}", "side": "yes" if i % 2 else "no",
+     "shares": float(i), "cost": float(i), "redeemed": False, "created_at": f"2026-01-01T00:00:{i:02d}+00:00"}
+    for i in range(12)
+]
+FIELDS = export_service.EXPORT_SCHEMAS["positions"]
+
+
+async def _batches(size=5):
+    for start in range(0, len(DOCS), size):
+        yield DOCS[start:start + size]
+
+
+def _collect(stream):
+    async def run():
+        return [chunk async for chunk in stream]
+    return asyncio.run(run())
+
+
+def test_csv_stream_round_trips_one_chunk_per_batch():
+    chunks = _collect(export_service.stream_csv(_batches(), FIELDS))
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(b"".join(chunks)).decode())))
+
+    assert len(chunks) >= 3
+    assert [row["id"] for row in rows] == [doc["id"] for doc in DOCS]
+    assert rows[3]["shares"] == "3.0"
+
+
+def test_parquet_stream_writes_a_row_group_per_batch():
+    data = b"".join(_collect(export_service.stream_arrow(_batches(), FIELDS, "parquet")))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+
+    assert parquet.num_row_groups == 3
+    assert parquet.read().column("user").to_pylist() == [doc["user"] for doc in DOCS]
+
+
+def test_arrow_stream_encodes_json_columns():
+    fields = export_service.EXPORT_SCHEMAS["tasks"]
+    docs = [{"id": "t1", "waypoints": [{"lat": 1.0, "lon": 2.0}], "success": None, "created_at": "x"}]
+
+    async def batches():
+        yield docs
+
+    data = b"".join(_collect(export_service.stream_arrow(batches(), fields, "arrow")))
+    table = pa.ipc.open_stream(data).read_all()
+
+    assert json.loads(table.column("waypoints")[0].as_py()) == docs[0]["waypoints"]
+    assert table.column("success")[0].as_py() is None
+
+
+def test_export_query_bounds_by_watermark():
+    assert export_service.export_query("a", "b") == {"created_at": {"$gt": "a", "$lte": "b"}}
+    assert export_service.export_query() == {}
+
+
+def test_normalize_timestamp_to_utc_isoformat():
+    assert export_service.normalize_timestamp("2026-01-01T02:00:00+02:00") == "2026-01-01T00:00:00+00:00"
+    assert export_service.normalize_timestamp("2026-01-01T00:00:00Z") == "2026-01-01T00:00:00+00:00"
+    assert export_service.normalize_timestamp("2026-01-01T00:00:00") == "2026-01-01T00:00:00+00:00"
+
+
+def test_normalize_timestamp_rejects_invalid():
+    with pytest.raises(ValueError):
+        export_service.normalize_timestamp("last tuesday")
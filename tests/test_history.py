@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_bucket_start_floors_to_resolution():
+    ts = datetime(2024, 5, 1, 13, 47, 29, 500000, tzinfo=timezone.utc)
+    assert server._bucket_start(ts, 60) == datetime(2024, 5, 1, 13, 47, tzinfo=timezone.utc)
+    assert server._bucket_start(ts, 900) == datetime(2024, 5, 1, 13, 45, tzinfo=timezone.utc)
+    assert server._bucket_start(ts, 14400) == datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    assert server._bucket_start(ts, 86400) == datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def test_bucket_start_matches_stored_key_format():
+    ts = datetime(2024, 5, 1, 13, 47, 29, tzinfo=timezone.utc)
+    assert server._bucket_start(ts, 300).isoformat() == "2024-05-01T13:45:00+00:00"
+
+
+def test_timestamp_param_accepts_z_suffix():
+    assert server._timestamp_param("2024-05-01T13:45:00Z", "start") == "2024-05-01T13:45:00+00:00"
+
+
+def test_timestamp_param_converts_offsets_to_utc():
+    assert server._timestamp_param("2024-05-01T15:45:00+02:00", "start") == "2024-05-01T13:45:00+00:00"
+
+
+def test_timestamp_param_treats_naive_as_utc():
+    assert server._timestamp_param("2024-05-01T13:45:00", "end") == "2024-05-01T13:45:00+00:00"
+
+
+def test_timestamp_param_rejects_invalid():
+    with pytest.raises(HTTPException) as exc:
+        server._timestamp_param("yesterday", "start")
+    assert exc.value.status_code == 400
+
+
+def test_history_rejects_unknown_resolution():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.get_task_history("task", resolution="2m"))
+    assert exc.value.status_code == 400
+
+
+def test_rollup_pipeline_reads_only_1m_bars():
+    pipeline = server._rollup_pipeline("1h", ["a", "b"], "2024-05-01T13:00:00+00:00")
+    match = pipeline[0]["$match"]
+    assert match["resolution"] == "1m"
+    assert match["task_id"] == {"$in": ["a", "b"]}
+    assert match["start"] == {"$gte": "2024-05-01T13:00:00+00:00"}
+    assert pipeline[-1]["$merge"]["on"] == ["task_id", "resolution", "start"]
+
+
+def test_export_rejects_invalid_since():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.export_collection("tasks", since="not-a-date"))
+    assert exc.value.status_code == 400
@@ -0,0 +1,103 @@
+import asyncio
+import math
+import random
+import time
+
+import pytest
+from pydantic import ValidationError
+
+import server
+
+
+def collect_routes(points, dist, budget=5.0):
+    async def run():
+        return [route async for route in server._anytime_route(points, dist, time.monotonic() + budget)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("waypoints", [
+    [{"x": random.uniform(0, 100), "y": random.uniform(0, 100)} for _ in range(60)],
+    [{"lat": random.uniform(40, 41), "lon": random.uniform(-74, -73)} for _ in range(60)],
+])
+def test_anytime_route_yields_improving_permutations(waypoints):
+    points, dist = server._route_points(waypoints)
+    routes = collect_routes(points, dist)
+
+    assert routes
+    previous = math.inf
+    for order, length in routes:
+        assert order[0] == 0
+        assert sorted(order) == list(range(len(points)))
+        assert length == pytest.approx(server._path_length(points, order, dist))
+        assert length < previous
+        previous = length
+    assert server._mst_length(points, dist) <= previous + 1e-9
+
+
+def test_anytime_route_single_waypoint():
+    points, dist = server._route_points([{"x": 1, "y": 2}])
+    assert collect_routes(points, dist) == [([0], 0.0)]
+
+
+def test_anytime_route_past_deadline_still_returns_a_route():
+    points, dist = server._route_points([{"x": i % 7, "y": i // 7} for i in range(200)])
+    routes = collect_routes(points, dist, budget=0)
+    order, length = routes[-1]
+    assert order[0] == 0 and sorted(order) == list(range(200))
+
+
+def test_route_points_requires_coordinates_on_every_waypoint():
+    assert server._route_points([{"x": 1, "y": 2}, {"action": "scan"}]) == (None, None)
+    assert server._route_points([]) == (None, None)
+
+
+def test_mst_length_matches_known_value():
+    points = [(0.0, 0.0), (0.0, 1.0), (1.0, 1.0), (1.0, 0.0)]
+    assert server._mst_length(points, server._euclidean) == pytest.approx(3.0)
+
+
+@pytest.mark.parametrize("budget", [0, -1, 61])
+def test_time_budget_is_bounded(budget):
+    with pytest.raises(ValidationError):
+        server.AnytimeOptimizeRequest(task_id="t", time_budget=budget)
+
+
+def test_scored_routes_score_every_update_for_small_inputs():
+    points, dist = server._route_points([{"x": i * 3 % 8, "y": i * 5 % 8} for i in range(8)])
+
+    async def run():
+        return [route async for route in server._scored_routes(points, dist, time.monotonic() + 5)]
+
+    routes = asyncio.run(run())
+    assert routes
+    assert all(score is not None for _, _, score in routes)
+    assert [score for _, _, score in routes] == sorted(score for _, _, score in routes)
+
+
+def test_route_score_puts_the_estimated_optimum_at_100():
+    assert server._route_score(90.0, 100.0) == pytest.approx(100.0)
+    assert server._route_score(45.0, 100.0) == pytest.approx(50.0)
+    assert server._route_score(5.0, 0.0) == 100.0
+
+
+@pytest.mark.parametrize("waypoints", [
+    [{"x": "a", "y": 1}, {"x": 2, "y": 3}],
+    [{"x": None, "y": 1}],
+    [{"lat": "nan", "lon": 1}],
+])
+def test_route_points_rejects_non_numeric_coordinates(waypoints):
+    assert server._route_points(waypoints) == (None, None)
+
+
+def test_route_points_accepts_lng_alias():
+    points, dist = server._route_points([{"lat": "1.5", "lng": 2}, {"lat": 3, "lon": 4}])
+    assert points == [(1.5, 2.0), (3.0, 4.0)]
+    assert dist is server._haversine_km
+
+
+def test_solutions_fall_back_to_mock_without_coordinates():
+    async def run():
+        return [s async for s in server._solutions([{"action": "scan"}], time.monotonic() + 1)]
+
+    [(order, length, score)] = asyncio.run(run())
+    assert order == [0] and length is None and 85.0 <= score <= 98.0
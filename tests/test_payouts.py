@@ -0,0 +1,174 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import server
+
+
+# ----- cache -----
+
+def test_cache_hit_and_lru_eviction():
+    cache = server._TTLCache(max_entries=2)
+    for task_id in ("t1", "t2", "t3"):
+        cache.put(("task", task_id, 0), [task_id])
+    assert cache.get(("task", "t1", 0)) is None
+    assert cache.get(("task", "t3", 0)) == ["t3"]
+
+
+def test_cache_entries_expire():
+    cache = server._TTLCache(ttl=0.0)
+    cache.put(("task", "t1", 0), ["payouts"])
+    assert cache.get(("task", "t1", 0)) is None
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class _Tasks:
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+    async def find_one(self, query, projection=None):
+        return dict(self.tasks[query["id"]]) if query["id"] in self.tasks else None
+
+    def find(self, query, projection=None):
+        return _Cursor([dict(self.tasks[t]) for t in query["id"]["$in"] if t in self.tasks])
+
+
+class _Positions:
+    def __init__(self, user_markets):
+        self.user_markets = user_markets
+        self.aggregations = 0
+
+    async def distinct(self, field, query):
+        return self.user_markets
+
+    def aggregate(self, pipeline):
+        self.aggregations += 1
+        return _Cursor([{"task_id": t, "cost": 1.0, "final_payout": None, "claimable": None}
+                        for t in self.user_markets])
+
+
+class _DB:
+    def __init__(self, tasks, user_markets):
+        self.tasks = _Tasks(tasks)
+        self.positions = _Positions(user_markets)
+
+
+def test_task_payouts_cached_until_payout_version_moves(monkeypatch):
+    fake_db = _DB({"t1": {"id": "t1", "payout_version": 3}}, ["t1"])
+    monkeypatch.setattr(server, "db", fake_db)
+    monkeypatch.setattr(server, "payout_cache", server._TTLCache())
+
+    asyncio.run(server.get_task_payouts("t1"))
+    asyncio.run(server.get_task_payouts("t1"))
+    assert fake_db.positions.aggregations == 1
+
+    # A trade, resolution or redemption in any worker bumps the version
+    fake_db.tasks.tasks["t1"]["payout_version"] = 4
+    asyncio.run(server.get_task_payouts("t1"))
+    assert fake_db.positions.aggregations == 2
+
+
+def test_user_payouts_cached_until_any_market_or_the_market_set_changes(monkeypatch):
+    tasks = {"t1": {"id": "t1", "payout_version": 1}, "t2": {"id": "t2", "payout_version": 1}}
+    fake_db = _DB(tasks, ["t1"])
+    monkeypatch.setattr(server, "db", fake_db)
+    monkeypatch.setattr(server, "payout_cache", server._TTLCache())
+
+    asyncio.run(server.get_user_payouts("u"))
+    asyncio.run(server.get_user_payouts("u"))
+    assert fake_db.positions.aggregations == 1
+
+    # Another market's version doesn't matter until the user trades in it
+    tasks["t2"]["payout_version"] = 2
+    asyncio.run(server.get_user_payouts("u"))
+    assert fake_db.positions.aggregations == 1
+
+    fake_db.positions.user_markets = ["t1", "t2"]
+    asyncio.run(server.get_user_payouts("u"))
+    assert fake_db.positions.aggregations == 2
+
+    tasks["t1"]["payout_version"] = 2
+    asyncio.run(server.get_user_payouts("u"))
+    assert fake_db.positions.aggregations == 3
+
+
+# ----- aggregation pipeline (needs a MongoDB at MONGO_URL) -----
+
+def _mongo_available():
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+def _legacy_payout(task, positions):
+    # The per-position loop redeem_position used before the pipeline
+    total_payout = 0.0
+    winning_side = "yes" if task["success"] else "no"
+    total_pool = task["yes_pool"] + task["no_pool"]
+    for pos in positions:
+        if pos["side"] == winning_side:
+            if winning_side == "yes" and task["yes_shares"] > 0:
+                payout = (pos["shares"] / task["yes_shares"]) * total_pool
+            elif winning_side == "no" and task["no_shares"] > 0:
+                payout = (pos["shares"] / task["no_shares"]) * total_pool
+            else:
+                payout = 0.0
+            total_payout += payout
+    return total_payout
+
+
+@pytest.mark.skipif(not _mongo_available(), reason="MongoDB not reachable")
+@pytest.mark.parametrize("success", [True, False])
+def test_market_payouts_match_legacy_loop(monkeypatch, success):
+    trades = [("alice", "yes", 10.0), ("bob", "no", 5.0), ("alice", "no", 2.0),
+              ("carol", "yes", 30.0), ("bob", "yes", 1.5)]
+    task = {
+        "id": str(uuid.uuid4()),
+        "status": "resolved",
+        "success": success,
+        "yes_pool": sum(a for _, side, a in trades if side == "yes"),
+        "no_pool": sum(a for _, side, a in trades if side == "no"),
+    }
+    task["yes_shares"], task["no_shares"] = task["yes_pool"], task["no_pool"]
+    positions = [
+        {"id": str(uuid.uuid4()), "task_id": task["id"], "user": user, "side": side,
+         "shares": amount, "cost": amount, "redeemed": False}
+        for user, side, amount in trades
+    ]
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        test_db = client[os.environ["DB_NAME"] + "_payouts_" + uuid.uuid4().hex[:8]]
+        monkeypatch.setattr(server, "db", test_db)
+        try:
+            await test_db.tasks.insert_one(dict(task))
+            await test_db.positions.insert_many([dict(p) for p in positions])
+            by_market = await server._market_payouts(task)
+            by_user = {user: await server._user_payouts(user) for user in ("alice", "bob", "carol")}
+        finally:
+            await client.drop_database(test_db.name)
+            client.close()
+        return by_market, by_user
+
+    by_market, by_user = asyncio.run(run())
+
+    for entry in by_market:
+        expected = _legacy_payout(task, [p for p in positions if p["user"] == entry["user"]])
+        assert entry["final_payout"] == pytest.approx(expected)
+        assert entry["claimable"] == pytest.approx(expected)
+        assert by_user[entry["user"]][0]["final_payout"] == pytest.approx(expected)
+    assert {entry["user"] for entry in by_market} == {"alice", "bob", "carol"}
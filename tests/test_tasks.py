@@ -0,0 +1,35 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_waypoints_geojson_orders_lon_lat():
+    location = server._waypoints_geojson([{"lat": 52.5, "lon": 13.4}, {"lat": -33.9, "lon": 151.2}])
+    assert location == {"type": "MultiPoint", "coordinates": [[13.4, 52.5], [151.2, -33.9]]}
+
+
+def test_waypoints_geojson_accepts_lng_alias():
+    location = server._waypoints_geojson([{"lat": 40.7, "lng": -74.0}])
+    assert location["coordinates"] == [[-74.0, 40.7]]
+
+
+def test_waypoints_geojson_skips_waypoints_without_coordinates():
+    location = server._waypoints_geojson([{"name": "depot"}, {"lat": 1.0, "lon": 2.0}, {"lat": 3.0}])
+    assert location["coordinates"] == [[2.0, 1.0]]
+
+
+def test_waypoints_geojson_without_coordinates_is_none():
+    assert server._waypoints_geojson([]) is None
+    assert server._waypoints_geojson([{"name": "depot"}, {"x": 1, "y": 2}]) is None
+
+
+@pytest.mark.parametrize("waypoint", [
+    {"lat": 91.0, "lon": 0.0},
+    {"lat": 0.0, "lon": -180.5},
+    {"lat": "north", "lon": 0.0},
+])
+def test_waypoints_geojson_rejects_invalid_coordinates(waypoint):
+    with pytest.raises(HTTPException) as exc:
+        server._waypoints_geojson([waypoint])
+    assert exc.value.status_code == 400